@@ -1,20 +1,25 @@
+import io
 import re
 import os
 import uuid
 import time
+import random
 import json
 import httpx
+import asyncio
+import orjson
 import uvicorn
 import hashlib
 import secrets
 import logging
+import functools
 from version import VERSION
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from fake_useragent import UserAgent
 from fastapi.security import APIKeyHeader
 from typing import List, Literal, Optional
-from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, HTTPException, Depends
 
@@ -32,6 +37,10 @@ MAX_CHARS = int(os.getenv("MAX_CHARS", "80000"))  # 从 .env 获取 MAX_CHARS，
 RANDOM_UA = os.getenv("RANDOM_UA", "False").lower() in ("true", "1", "yes")  # 是否随机UA，默认 False
 
 # 设置日志（单行输出，中文）
+# 日志格式未用到线程/进程信息，关闭采集以减少每条日志的开销
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL, logging.INFO),
     format="%(asctime)s - %(levelname)s - %(message)s",  # noqa
@@ -43,8 +52,24 @@ logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.ERROR)
 logging.getLogger("httpcore").setLevel(logging.ERROR)
 
+
+# 应用生命周期内复用同一个 httpx 客户端，避免每次请求重新握手
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = httpx.AsyncClient(
+        http2=True,
+        timeout=1200,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+    )
+    app.state.client = client
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
 # 初始化 FastAPI 应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 根据配置启用跨域
 if ENABLE_CORS:
@@ -66,7 +91,13 @@ default_user_agent = (
     "AppleWebKit/537.36 (KHTML, like Gecko) "
     "Chrome/133.0.0.0 Safari/537.36"
 )
-ua = UserAgent()  # 初始化 fake-useragent 的 UserAgent 对象
+# 启用随机 UA 时，启动阶段一次性从 fake-useragent 生成 UA 池，请求时只需从池中随机挑选
+if RANDOM_UA:
+    from fake_useragent import UserAgent
+    ua = UserAgent()
+    ua_pool = tuple(ua.random for _ in range(64))
+else:
+    ua_pool = (default_user_agent,)
 
 # 支持的模型和对应的 userAction 映射
 supported_models = [
@@ -114,37 +145,62 @@ model_to_user_action = {
     'ernie-4.5-turbo-32k-search': {'model': 'ernie-4.5-turbo', 'user_action': ["online"]},
 }
 
-# 用于存储 device_id 对应的 User-Agent
-device_ua_map = {}
+# 预先计算每个模型对应的 (model, userAction 字符串)，以及用于 O(1) 判断的模型集合
+model_lookup = {k: (v['model'], ",".join(v['user_action'])) for k, v in model_to_user_action.items()}
+supported_model_set = frozenset(supported_models)
+# r1 模型的 card 内容延后到回答末尾输出
+r1_model_set = frozenset({"deepseek-r1", "deepseek-r1-search"})
+
+# /v1/models 的响应在运行期间不变，启动时一次性构建并编码
+models_response_body = orjson.dumps({
+    "object": "list",
+    "data": [
+        {
+            "id": model,
+            "object": "model",
+            "created": int(time.time()),
+            "owned_by": "dangbei"  # noqa
+        } for model in supported_models
+    ]
+})
+
+# 预编译正则，避免在逐行处理时重复查找 re 缓存
+THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+DETAILS_RE = re.compile(r"<details>.*?</details>", re.DOTALL)
+
+# nanoid 字母表及其对应的字节映射表
+url_alphabet = "abcdefgh0ijkl1mno2pqrs3tuv4wxyz5ABCDEFGH6IJKL7MNO8PQRS9TUV-WXYZ_"
+nanoid_table = (url_alphabet * 4).encode("ascii")
 
 
 # 工具函数
 def nanoid(size=21):
-    url_alphabet = "abcdefgh0ijkl1mno2pqrs3tuv4wxyz5ABCDEFGH6IJKL7MNO8PQRS9TUV-WXYZ_"
-    return "".join(secrets.choice(url_alphabet) for _ in range(size))
+    # 随机字节经 256 字节映射表一次性转换为字母表字符（字母表长度 64，取模无偏差）
+    return secrets.token_bytes(size).translate(nanoid_table).decode("ascii")
 
 
 def generate_device_id():
     return f"{uuid.uuid4().hex}_{nanoid(20)}"
 
 
-def get_user_agent(device_id: str) -> str:
-    """根据 device_id 返回 User-Agent，保证同一会话使用相同 UA"""
-    if not RANDOM_UA:
-        return default_user_agent
-    if device_id not in device_ua_map:
-        device_ua_map[device_id] = ua.random  # 为新 device_id 生成随机 UA
-    return device_ua_map[device_id]
+def get_user_agent() -> str:
+    """返回本次请求使用的 User-Agent，每个请求只取一次并在创建会话和对话中复用"""
+    return random.choice(ua_pool)
 
 
 def generate_sign(timestamp: str, payload: dict, nonce: str) -> str:
-    payload_str = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
-    sign_str = f"{timestamp}{payload_str}{nonce}"
-    return hashlib.md5(sign_str.encode("utf-8")).hexdigest().upper()
+    # 分段写入 md5，避免为超长 payload 再拼接出一份完整字符串
+    payload_bytes = orjson.dumps(payload)
+    md5 = hashlib.md5()
+    md5.update(timestamp.encode("utf-8"))
+    md5.update(payload_bytes)
+    md5.update(nonce.encode("utf-8"))
+    return md5.hexdigest().upper()
 
 
 # 创建会话
-async def create_conversation(device_id: str, model_name) -> str:
+async def create_conversation(client: httpx.AsyncClient, device_id: str, user_agent: str, model_name,
+                              request_time: int) -> str:
     payload = {
         "metaData": {
             "writeCode": "",
@@ -155,7 +211,7 @@ async def create_conversation(device_id: str, model_name) -> str:
         },
         "isAnonymous": False
     }
-    timestamp = str(int(time.time()) - 20)
+    timestamp = str(request_time - 20)
     nonce = nanoid(21)
     sign = generate_sign(timestamp, payload, nonce)
     headers = {
@@ -165,7 +221,7 @@ async def create_conversation(device_id: str, model_name) -> str:
         "token": "",
         "Origin": "https://ai.dangbei.com",
         "Referer": "https://ai.dangbei.com/",
-        "User-Agent": get_user_agent(device_id),
+        "User-Agent": user_agent,
         "deviceId": device_id,
         "nonce": nonce,
         "sign": sign,
@@ -173,19 +229,18 @@ async def create_conversation(device_id: str, model_name) -> str:
         "content-type": "application/json",
     }
     api = f"{api_domain}/ai-search/conversationApi/v1/create"
-    async with httpx.AsyncClient(http2=True) as client:
-        response = await client.post(api, json=payload, headers=headers)
-        if response.status_code != 200:
-            logger.error(f"创建会话失败：HTTP {response.status_code}")
-            raise HTTPException(status_code=500, detail="创建会话失败")
-        data = response.json()
-        if data.get("success"):
-            conversation_id = data["data"]["conversationId"]
-            logger.info(f"[创建新会话] conversation_id: {conversation_id}, UA: {headers['User-Agent']}")
-            return conversation_id
-        else:
-            logger.error(f"创建会话失败：{data}")
-            raise HTTPException(status_code=500, detail="创建会话失败")
+    response = await client.post(api, json=payload, headers=headers)
+    if response.status_code != 200:
+        logger.error(f"创建会话失败：HTTP {response.status_code}")
+        raise HTTPException(status_code=500, detail="创建会话失败")
+    data = response.json()
+    if data.get("success"):
+        conversation_id = data["data"]["conversationId"]
+        logger.info(f"[创建新会话] conversation_id: {conversation_id}, UA: {headers['User-Agent']}")
+        return conversation_id
+    else:
+        logger.error(f"创建会话失败：{data}")
+        raise HTTPException(status_code=500, detail="创建会话失败")
 
 
 # 定义授权校验依赖
@@ -219,38 +274,46 @@ class ChatCompletionRequest(BaseModel):
     top_p: Optional[float] = 1
 
 
-# 生成流式响应块
-def generate_chunk(_id: str, created: int, model: str, delta: dict, finish_reason: Optional[str] = None):
-    chunk = {
+# 生成流式响应块的固定前缀（id/created/model 在整个流中不变，只需编码一次）
+def generate_chunk_prefix(_id: str, created: int, model: str) -> str:
+    head = orjson.dumps({
         "id": _id,
         "object": "chat.completion.chunk",
         "created": created,
         "model": model,
-        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
-    }
-    return f"data: {json.dumps(chunk)}\n\n"
+    }).decode()
+    return f'data: {head[:-1]},"choices":[{{"index":0,"delta":'
+
+
+# 生成流式响应块，只编码变化的 delta 和 finish_reason
+def generate_chunk(prefix: str, delta: dict, finish_reason: Optional[str] = None):
+    return f'{prefix}{orjson.dumps(delta).decode()},"finish_reason":{orjson.dumps(finish_reason).decode()}}}]}}\n\n'
 
 
 # 拼接 messages 数组为字符串
 def concatenate_messages(messages: List[Message]) -> str:
     concatenated = []
     for msg in messages:
-        content = re.sub(r"<think>.*?</think>", "", msg.content, flags=re.DOTALL).strip()
+        content = msg.content
+        if "<think>" in content:
+            content = THINK_RE.sub("", content)
+        content = content.strip()
         if content:
             concatenated.append(f"{msg.role.capitalize()}: {content}")
     return "\n".join(concatenated)
 
 
-# 处理 card 类型的内容（优化为表格展示）
+# 处理 card 类型的内容（优化为表格展示），相同的 card 内容直接复用解析结果
+@functools.lru_cache(maxsize=512)
 def parse_card_content(content: str) -> str:
     try:
-        card_data = json.loads(content)
+        card_data = orjson.loads(content)
         if card_data.get("cardType") == "DB-CARD-2":
             card_info = card_data.get("cardInfo", {})
             references = []
             for item in card_info.get("cardItems", []):
                 if item.get("type") == "2002":  # 搜索来源
-                    sources = json.loads(item.get("content", "[]"))
+                    sources = orjson.loads(item.get("content", "[]"))
                     for source in sources:
                         id_index = source.get("idIndex", "")
                         name = source.get("name", "")
@@ -263,58 +326,60 @@ def parse_card_content(content: str) -> str:
                 return header + "\n" + "\n".join(references)
             return "无法解析的新闻内容"
         return "不支持的 card 类型"
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         logger.warning(f"无法解析 card 内容：{content}")
         return "无法解析的新闻内容"
 
 
 # 按字符数截断 messages，保留上下文连贯性
 def truncate_messages(messages: List[Message], max_chars: int = MAX_CHARS) -> List[Message]:
-    total_chars = sum(len(msg.content) for msg in messages)
+    content_lens = [len(msg.content) for msg in messages]
+    total_chars = sum(content_lens)
     if total_chars <= max_chars:
         return messages
 
-    other_messages = [msg for msg in messages if msg.role not in ["user", "assistant"]]
-    other_chars = sum(len(msg.content) for msg in other_messages)
+    other_mask = [msg.role not in ("user", "assistant") for msg in messages]
+    other_messages = [msg for msg, is_other in zip(messages, other_mask) if is_other]
+    other_chars = sum(n for n, is_other in zip(content_lens, other_mask) if is_other)
 
     available_chars = max_chars - other_chars
     if available_chars <= 0:
         logger.warning("非 user/assistant 消息已超过字符限制，仅保留这些消息")
         return other_messages
 
-    ua_messages = [msg for msg in messages if msg.role in ["user", "assistant"]]
-    truncated_ua = []
+    # 从最新的 user/assistant 消息往前保留，直到超出可用字符数
+    kept = []
     current_chars = 0
-
-    for msg in reversed(ua_messages):
-        msg_chars = len(msg.content)
-        if current_chars + msg_chars <= available_chars:
-            truncated_ua.insert(0, msg)
-            current_chars += msg_chars
-        else:
+    for i in reversed(range(len(messages))):
+        if other_mask[i]:
+            continue
+        if current_chars + content_lens[i] > available_chars:
             break
+        kept.append(i)
+        current_chars += content_lens[i]
+    kept.reverse()
 
-    truncated_messages = other_messages + truncated_ua
+    truncated_messages = other_messages + [messages[i] for i in kept]
     logger.info(
         f"截断上下文：原始字符数 {total_chars}，"
-        f"截断后字符数 {sum(len(msg.content) for msg in truncated_messages)}，"
+        f"截断后字符数 {other_chars + current_chars}，"
         f"消息数 {len(truncated_messages)}"
     )
     return truncated_messages
 
 
-def prepare_request_payload(request: ChatCompletionRequest, device_id: str, conversation_id: str):
+# 构建对话请求体（不依赖会话ID，可与创建会话并行执行；conversationId 先占位以保持字段顺序）
+def build_request_payload(request: ChatCompletionRequest) -> dict:
     truncated_messages = truncate_messages(request.messages)
     concatenated_message = concatenate_messages(truncated_messages)
-    user_action = model_to_user_action.get(request.model, {}).get('user_action', [])
-    model = model_to_user_action.get(request.model, {}).get("model", "deepseek")
+    model, user_action = model_lookup.get(request.model, model_lookup["deepseek-v3"])
     payload = {
         "role": "user",
         "stream": True,
         "botCode": "AI_SEARCH",
-        "userAction": ",".join(user_action),
+        "userAction": user_action,
         "model": model,
-        "conversationId": conversation_id,
+        "conversationId": None,
         "question": concatenated_message,
         "anonymousKey": "",
         "chatOption": {
@@ -324,181 +389,201 @@ def prepare_request_payload(request: ChatCompletionRequest, device_id: str, conv
         "status": "local",
         "agentId": "",
     }
-    timestamp = str(int(time.time()))
+    return payload
+
+
+# 对填好会话ID的请求体签名并生成请求头
+def prepare_request_headers(payload: dict, device_id: str, user_agent: str, request_time: int) -> dict:
+    timestamp = str(request_time)
     nonce = nanoid(21)
     sign = generate_sign(timestamp, payload, nonce)
     headers = {
         "Origin": "https://ai.dangbei.com",
         "Referer": "https://ai.dangbei.com/",
-        "User-Agent": get_user_agent(device_id),
+        "User-Agent": user_agent,
         "deviceId": device_id,
         "nonce": nonce,
         "sign": sign,
         "timestamp": timestamp,
     }
-    return payload, headers
+    return headers
+
+
+# 按字节读取 SSE 响应并手动切行，只返回 data: 行的原始字节（不解码，orjson 可直接解析）
+async def iter_sse_data(response: httpx.Response):
+    buffer = b""
+    async for chunk in response.aiter_bytes(65536):
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.startswith(b"data:"):
+                yield memoryview(line)[5:]
+    if buffer.startswith(b"data:"):
+        yield memoryview(buffer)[5:]
+
+
+# 解析 SSE 事件为字典，跳过无法解析的数据
+async def iter_events(response: httpx.Response):
+    async for json_bytes in iter_sse_data(response):
+        try:
+            yield orjson.loads(json_bytes)
+        except orjson.JSONDecodeError:
+            json_str = bytes(json_bytes).decode("utf-8", errors="replace").rstrip("\r")
+            logger.warning(f"无法解析 JSON 数据：{json_str}")
+
+
+# 根据单个 SSE 事件更新思考/card 状态，返回需要输出的内容片段（流式与非流式共用）
+def reduce_event(state: dict, data: dict, is_r1_model: bool) -> List[str]:
+    content = data.get("content") or ""
+    if not content:
+        return []
+    if "<details>" in content:
+        content = DETAILS_RE.sub("", content)
+    content_type = data.get("content_type")
+    if content_type == "thinking":
+        if not state["thinking"]:
+            state["thinking"] = True
+            return ["<think>", content]
+        return [content]
+    if content_type == "text":
+        if state["thinking"]:
+            state["thinking"] = False
+            return ["</think>", content]
+        return [content]
+    if content_type == "card":
+        parsed_content = parse_card_content(content)
+        if is_r1_model:
+            state["card_content"] = parsed_content
+            return []
+        return [parsed_content + "\n\n"]
+    return []
+
+
+# 响应结束时补全未闭合的思考标签，并追加 r1 模型延后输出的 card 内容
+def finish_events(state: dict, is_r1_model: bool) -> List[str]:
+    parts = []
+    if state["thinking"]:
+        state["thinking"] = False
+        parts.append("</think>")
+    if is_r1_model and state["card_content"]:
+        parts.append(state["card_content"] + "\n\n")
+    return parts
 
 
 # 流式响应函数
-async def stream_response(request: ChatCompletionRequest, device_id: str, conversation_id: str):
-    payload, headers = prepare_request_payload(request, device_id, conversation_id)
+async def stream_response(client: httpx.AsyncClient, request: ChatCompletionRequest, payload: dict, headers: dict,
+                          conversation_id: str, request_time: int):
     api = f"{api_domain}/ai-search/chatApi/v1/chat"
     _id = f"chatcmpl-{uuid.uuid4().hex}"  # noqa
-    created = int(time.time())
-    logger.info(
-        f"开始流式响应，会话ID: {conversation_id}，"
-        f"UA：{headers['User-Agent']}，"
-        f"请求: {json.dumps(payload, ensure_ascii=False)}"
-    )
-    yield generate_chunk(_id, created, request.model, {"role": "assistant"})
-    thinking = False
+    prefix = generate_chunk_prefix(_id, request_time, request.model)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"开始流式响应，会话ID: {conversation_id}，"
+            f"UA：{headers['User-Agent']}，"
+            f"请求: {json.dumps(payload, ensure_ascii=False)}"
+        )
+    yield generate_chunk(prefix, {"role": "assistant"})
+    # 累积的内容仅用于结束时的日志，INFO 日志关闭时不再收集
+    log_content = logger.isEnabledFor(logging.INFO)
     content_parts = []
-    card_content = None
-    is_r1_model = request.model in ["deepseek-r1", "deepseek-r1-search"]
-
-    async with httpx.AsyncClient(http2=True) as client:
-        async with client.stream("POST", api, json=payload, headers=headers, timeout=1200) as response:
-            if response.status_code != 200:
-                error_msg = f"错误：无法获取响应，状态码: {response.status_code}"
-                logger.error(error_msg)
-                yield generate_chunk(_id, created, request.model, {"content": error_msg}, "stop")
-                return
-            async for line in response.aiter_lines():
-                if line.startswith("data:"):
-                    json_str = line[5:]
-                    try:
-                        data = json.loads(json_str)
-                        content = data.get("content") or ""
-                        if content:
-                            content = re.sub(r"<details>.*?</details>", "", content, flags=re.DOTALL)
-                            if data.get("content_type") == "thinking":
-                                if not thinking:
-                                    thinking = True
-                                    content_parts.append("<think>")
-                                    yield generate_chunk(_id, created, request.model, {"content": "<think>"})
-                                content_parts.append(content)
-                                yield generate_chunk(_id, created, request.model, {"content": content})
-                            elif data.get("content_type") == "text":
-                                if thinking:
-                                    thinking = False
-                                    content_parts.append("</think>")
-                                    yield generate_chunk(_id, created, request.model, {"content": "</think>"})
-                                content_parts.append(content)
-                                yield generate_chunk(_id, created, request.model, {"content": content})
-                            elif data.get("content_type") == "card":
-                                parsed_content = parse_card_content(content)
-                                if is_r1_model:
-                                    card_content = parsed_content
-                                else:
-                                    content_parts.append(parsed_content + "\n\n")
-                                    yield generate_chunk(_id, created, request.model,
-                                                         {"content": parsed_content + "\n\n"})
-                    except json.JSONDecodeError:
-                        logger.warning(f"无法解析 JSON 数据：{json_str}")
-                        continue
-            if thinking:
-                content_parts.append("</think>")
-                yield generate_chunk(_id, created, request.model, {"content": "</think>"})
-            if is_r1_model and card_content:
-                content_parts.append(card_content + "\n\n")
-                yield generate_chunk(_id, created, request.model, {"content": card_content + "\n\n"})
-            yield generate_chunk(_id, created, request.model, {}, "stop")
+    state = {"thinking": False, "card_content": None}
+    is_r1_model = request.model in r1_model_set
+
+    async with client.stream("POST", api, json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            error_msg = f"错误：无法获取响应，状态码: {response.status_code}"
+            logger.error(error_msg)
+            yield generate_chunk(prefix, {"content": error_msg}, "stop")
+            return
+        async for data in iter_events(response):
+            for part in reduce_event(state, data, is_r1_model):
+                if log_content:
+                    content_parts.append(part)
+                yield generate_chunk(prefix, {"content": part})
+        for part in finish_events(state, is_r1_model):
+            if log_content:
+                content_parts.append(part)
+            yield generate_chunk(prefix, {"content": part})
+        yield generate_chunk(prefix, {}, "stop")
+        if log_content:
             content = "".join(content_parts)
-            logger.info(f"流式响应完成，会话ID: {conversation_id}，内容: {json.dumps(content, ensure_ascii=False)}")
+            logger.info(
+                f"流式响应完成，会话ID: {conversation_id}，"
+                f"内容: {json.dumps(content, ensure_ascii=False)}"
+            )
 
 
 # 主端点
 @app.post("/v1/chat/completions")
 async def chat_completions(request: ChatCompletionRequest, _: None = Depends(check_authorization)):
-    logger.info(f"接收到请求: {json.dumps(request.model_dump(), ensure_ascii=False)}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"接收到请求: {json.dumps(request.model_dump(), ensure_ascii=False)}")
 
-    if request.model not in supported_models:
+    if request.model not in supported_model_set:
         request.model = "deepseek-v3"
 
+    client = app.state.client
     device_id = generate_device_id()
-    print(f"device_id: {device_id}")
-    conversation_id = await create_conversation(device_id, request.model)
+    user_agent = get_user_agent()
+    logger.debug(f"device_id: {device_id}")
+    # 同一请求内的签名时间戳与 created 共用一次取到的时间
+    request_time = int(time.time())
+    # 截断/拼接消息在线程中执行，与创建会话的网络请求重叠
+    payload, conversation_id = await asyncio.gather(
+        asyncio.to_thread(build_request_payload, request),
+        create_conversation(client, device_id, user_agent, request.model, request_time),
+    )
+    payload["conversationId"] = conversation_id
+    headers = prepare_request_headers(payload, device_id, user_agent, request_time)
 
     if request.stream:
-        return StreamingResponse(stream_response(request, device_id, conversation_id), media_type="text/event-stream")
+        return StreamingResponse(
+            stream_response(client, request, payload, headers, conversation_id, request_time),
+            media_type="text/event-stream"
+        )
 
-    payload, headers = prepare_request_payload(request, device_id, conversation_id)
     api = f"{api_domain}/ai-search/chatApi/v1/chat"
-    content_parts = []
-    card_content = None
-    thinking = False
-    is_r1_model = request.model in ["deepseek-r1", "deepseek-r1-search"]
-    logger.info(
-        f"开始非流式响应，会话ID: {conversation_id}，"
-        f"UA: {headers['User-Agent']}，"
-        f"请求: {json.dumps(payload, ensure_ascii=False)}"
-    )
-    async with httpx.AsyncClient(http2=True) as client:
-        async with client.stream("POST", api, json=payload, headers=headers, timeout=1200) as response:
-            if response.status_code != 200:
-                error_msg = f"无法从 API 获取响应，状态码: {response.status_code}"
-                logger.error(error_msg)
-                raise HTTPException(status_code=500, detail=error_msg)
-            async for line in response.aiter_lines():
-                if line.startswith("data:"):
-                    json_str = line[5:]
-                    try:
-                        data = json.loads(json_str)
-                        content = data.get("content") or ""
-                        if content:
-                            content = re.sub(r"<details>.*?</details>", "", content, flags=re.DOTALL)
-                            if data.get("content_type") == "thinking":
-                                if not thinking:
-                                    thinking = True
-                                    content_parts.append("<think>")
-                                content_parts.append(content)
-                            elif data.get("content_type") == "text":
-                                if thinking:
-                                    thinking = False
-                                    content_parts.append("</think>")
-                                content_parts.append(content)
-                            elif data.get("content_type") == "card":
-                                parsed_content = parse_card_content(content)
-                                if is_r1_model:
-                                    card_content = parsed_content
-                                else:
-                                    content_parts.append(parsed_content + "\n\n")
-                    except json.JSONDecodeError:
-                        logger.warning(f"无法解析 JSON 数据：{json_str}")
-                        continue
-    if thinking:
-        content_parts.append("</think>")
-    if is_r1_model and card_content:
-        content_parts.append(card_content + "\n\n")
-    content = "".join(content_parts)
+    buffer = io.StringIO()
+    state = {"thinking": False, "card_content": None}
+    is_r1_model = request.model in r1_model_set
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"开始非流式响应，会话ID: {conversation_id}，"
+            f"UA: {headers['User-Agent']}，"
+            f"请求: {json.dumps(payload, ensure_ascii=False)}"
+        )
+    async with client.stream("POST", api, json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            error_msg = f"无法从 API 获取响应，状态码: {response.status_code}"
+            logger.error(error_msg)
+            raise HTTPException(status_code=500, detail=error_msg)
+        async for data in iter_events(response):
+            buffer.writelines(reduce_event(state, data, is_r1_model))
+    buffer.writelines(finish_events(state, is_r1_model))
+    content = buffer.getvalue()
 
     response_data = {
         "id": f"chatcmpl-{uuid.uuid4().hex}",  # noqa
         "object": "chat.completion",
-        "created": int(time.time()),
+        "created": request_time,
         "model": request.model,
         "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
         "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
     }
-    logger.info(f"响应: {json.dumps(response_data, ensure_ascii=False)}")
-    return response_data
+    # 直接用 orjson 编码响应体，长内容时比 FastAPI 默认的 JSON 序列化快
+    body = orjson.dumps(response_data)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"响应: {body.decode()}")
+    return Response(content=body, media_type="application/json")
 
 
 # /models 端点
 @app.get("/v1/models")
 async def list_models(_: None = Depends(check_authorization)):
     logger.info("接收到 /models 请求")
-    models = [
-        {
-            "id": model,
-            "object": "model",
-            "created": int(time.time()),
-            "owned_by": "dangbei"  # noqa
-        } for model in supported_models
-    ]
-    response_data = {"object": "list", "data": models}
-    logger.info(f"模型响应: {json.dumps(response_data, ensure_ascii=False)}")
-    return response_data
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"模型响应: {models_response_body.decode()}")
+    return Response(content=models_response_body, media_type="application/json")
 
 
 if __name__ == "__main__":